@@ -0,0 +1,36 @@
+import os
+import time
+import geopandas as gpd
+from cycleosm.bikeosm import BikeOSM
+from cycleosm.arrowio import read_ways_feather
+output_path = r'/Users/danielpatterson/Documents/output'
+urls = {'District of Columbia': 'http://download.geofabrik.de/north-america/us/district-of-columbia-latest.osm.pbf'}
+repeats = 5
+
+
+def best_of(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+# write the same ways in both formats
+BikeOSM(urls, output_path).handle_pbfs(handle_nodes=False)
+BikeOSM(urls, output_path).handle_pbfs(handle_nodes=False, output_format='feather')
+
+for filename in urls:
+    shp = os.path.join(output_path, filename + '_ways.shp')
+    feather = os.path.join(output_path, filename + '_ways.feather')
+
+    results = {
+        'shapefile (gpd.read_file)': best_of(lambda: gpd.read_file(shp), repeats),
+        'feather, decoded geometries': best_of(lambda: read_ways_feather(feather), repeats),
+        'feather, memory-mapped table': best_of(lambda: read_ways_feather(feather, decode_geometry=False), repeats),
+    }
+
+    print(f"Read-back of {filename} ways, best of {repeats}:")
+    for name, seconds in results.items():
+        print(f"    {name:<30} {seconds:8.3f} s")
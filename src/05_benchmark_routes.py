@@ -0,0 +1,39 @@
+import os
+import time
+from cycleosm.bikeosm import BikeOSM
+from cycleosm.pbfdownloader import PBFDownloader
+from cycleosm.routes import BicycleRouteCollector
+output_path = r'/Users/danielpatterson/Documents/output'
+urls = {'District of Columbia': 'http://download.geofabrik.de/north-america/us/district-of-columbia-latest.osm.pbf'}
+repeats = 3
+
+
+def best_of(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def read(filename, route_relations):
+    osm = BikeOSM(urls, output_path)
+    osm.route_collector = BicycleRouteCollector() if route_relations else None
+    osm.read_pbf(filename)
+
+
+# overhead of reading route=bicycle relations and joining them to the ways, against the node and way only read.
+# only the file read is timed, output writing is the same in both cases.
+downloader = PBFDownloader(urls, output_path)
+for filename, url in urls.items():
+    downloader.download_pbf(url, filename)
+    pbf = os.path.join(output_path, filename + '.pbf')
+
+    single_pass = best_of(lambda: read(pbf, route_relations=False), repeats)
+    with_routes = best_of(lambda: read(pbf, route_relations=True), repeats)
+
+    print(f"{filename}, best of {repeats}:")
+    print(f"    Nodes and ways:               {single_pass:8.3f} s")
+    print(f"    With route relations and join: {with_routes:8.3f} s")
+    print(f"    Overhead: {100 * (with_routes - single_pass) / single_pass:.1f}%")
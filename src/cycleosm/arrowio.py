@@ -0,0 +1,51 @@
+"""
+Arrow IPC (Feather) hand-off of extraction results.
+
+BikeOSM can publish each state's ways as an uncompressed Feather file (handle_pbfs(output_format='feather')).
+Uncompressed Arrow IPC files can be memory-mapped, so downstream consumers attach to the columns without
+parsing the file again. Geometries are stored as WKB and are only decoded into shapely objects on request.
+
+Placing output_path on a tmpfs mount (e.g. /dev/shm) keeps the hand-off entirely in shared memory.
+"""
+
+from typing import List, Optional
+import geopandas as gpd
+import pyarrow as pa
+
+
+def write_ways_feather(ways_df: gpd.GeoDataFrame, filepath: str) -> None:
+    """
+    Writes a way GeoDataFrame to an uncompressed Feather file so it can be memory-mapped on read.
+    Categorical columns are written as Arrow dictionary columns.
+
+    Args:
+        ways_df (gpd.GeoDataFrame): Ways, e.g. from BikeOSM.ways_dataframe().
+        filepath (str): Destination file path.
+    """
+    ways_df.to_feather(filepath, compression='uncompressed')
+
+
+def read_ways_feather(filepath: str, columns: Optional[List[str]] = None, decode_geometry: bool = True):
+    """
+    Memory-maps a Feather file written by write_ways_feather.
+
+    Args:
+        filepath (str): Path to the Feather file.
+        columns (Optional[List[str]]): Subset of columns to read. Defaults to all columns.
+        decode_geometry (bool, optional): If True, returns a GeoDataFrame with shapely geometries.
+            If False, returns the zero-copy pyarrow Table with WKB geometries. Defaults to True.
+
+    Returns:
+        Union[gpd.GeoDataFrame, pd.DataFrame, pyarrow.Table]: Ways. A DataFrame without geometries
+            if geometry is decoded but not among columns.
+    """
+    if decode_geometry:
+        # geopandas requires the geometry column, drop it afterwards if it was not asked for
+        if columns is not None and 'geometry' not in columns:
+            return gpd.read_feather(filepath, columns=list(columns) + ['geometry'], memory_map=True).drop(columns='geometry')
+        return gpd.read_feather(filepath, columns=columns, memory_map=True)
+
+    table = pa.ipc.open_file(pa.memory_map(filepath, 'r')).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
@@ -15,10 +15,17 @@ import shapely.wkb as wkblib
 import time
 import os
 import geopandas as gpd
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
+import numpy as np
+import pandas as pd
 import logging
 from cycleosm.pbfdownloader import PBFDownloader
 from cycleosm.utils import Utils 
+from cycleosm.encoding import TagEncoder, TagVocabulary
+from cycleosm.arrowio import write_ways_feather
+from cycleosm.routes import BicycleRouteCollector, NETWORK_LEVELS
+from cycleosm.tiles import check_zoom, remove_tiles, write_tiles
+from cycleosm.tagcache import TagCache, read_tag_cache
 
 wkbfab = osmium.geom.WKBFactory()
 
@@ -26,6 +33,18 @@ wkbfab = osmium.geom.WKBFactory()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# columns of the way table, in output order
+WAY_COLUMNS = [
+    'id', 'fclass', 'name', 'ln_mrkngs', 'svc_rd_typ', 'turn', 'maxspeed', 'trf_sgnl', 'surface', 'oneway',
+    'lanes_fwd', 'lanes_bwd', 'lanes_tot', 'osmbk_left', 'osmbk_rght', 'bk_route', 'bk_network', 'bk_rt_ref',
+    'bk_rt_name', 'bkwid_left', 'bkwid_rght', 'bkinf_left', 'bkinf_rght', 'min_bk_inf', 'max_bk_inf', 'geometry'
+]
+
+OUTPUT_FORMATS = ('shp', 'parquet', 'feather', 'tiles')
+
+# directory of tile-partitioned ways, shared by all files
+TILES_DIRNAME = 'ways_tiles'
+
 class BikeOSM(osmium.SimpleHandler, Utils):
     """
         This module provides classes to download and extract OpenStreetMap (OSM) PBF files. 
@@ -62,7 +81,6 @@ class BikeOSM(osmium.SimpleHandler, Utils):
         cyclewaysfile: Optional[str]  = None,
         not_bike_facsfile: Optional[str] = None
         ):
-        self.ways = []
         self.traffic_signal_ids = []
         self.nodes = {'id': [], 'trfc_sgnls': [], 'geometry': []}
         self.pbf_dict = pbf_dict
@@ -83,11 +101,83 @@ class BikeOSM(osmium.SimpleHandler, Utils):
         self.not_bike_facsfile  = static_filepath(cpp, sttc, nb) if not_bike_facsfile == None else not_bike_facsfile
         self.fclassfile  = static_filepath(cpp, sttc, fc) if fclassfile == None else fclassfile
          
-   
+        self.reload_rules()
+
+        self.ways = self._new_ways()
+        self.route_collector = BicycleRouteCollector()
+        self.tag_cache = None
+
+    def reload_rules(self):
+        """
+        (Re)loads the rule tables from the static files, e.g. after editing 'osm_links - tags.csv' or 'osm_links - not_bikelanes.txt'.
+        The categorical encoder is rebuilt from the new tables, so ways read before the reload must be written first.
+        """
         self.fclass = self._load_txt(self.fclassfile)
         self.not_bike_facs = self._load_txt(self.not_bike_facsfile)
         self.biketags = self._load_txt(self.biketagsfile) 
         self.cycleways = self._load_csv_as_dict(self.cyclewaysfile)
+        self.encoder = self._build_encoder()
+
+    def _build_encoder(self):
+        """
+        Builds the categorical encoder for the way table. Vocabularies are seeded from the static rule files,
+        values not found there (e.g. surface, name, unusual cycleway tags) are added to each vocabulary's overflow.
+        """
+        bike_infra = TagVocabulary(
+            list(self.cycleways.values()) + ['Buffered Bike Lane', 'Shared Use Path', 'Unknown']
+        )
+        osm_bike_infra = TagVocabulary(
+            ['Cycleway'] + [k.capitalize() for k in self.cycleways.keys()] + list(self.cycleways.values())
+        )
+        return TagEncoder({
+            'fclass': TagVocabulary(self.fclass),
+            'name': TagVocabulary(),
+            'surface': TagVocabulary(),
+            'oneway': TagVocabulary(['No', 'Yes']),
+            'bk_route': TagVocabulary(['Bicycle Route']),
+            'bk_network': TagVocabulary(NETWORK_LEVELS),
+            'bk_rt_ref': TagVocabulary(),
+            'bk_rt_name': TagVocabulary(),
+            'osmbk_left': osm_bike_infra,
+            'osmbk_rght': osm_bike_infra,
+            'bkinf_left': bike_infra,
+            'bkinf_rght': bike_infra,
+            'min_bk_inf': bike_infra,
+            'max_bk_inf': bike_infra,
+        })
+
+    def _new_ways(self):
+        """
+        Returns an empty, column oriented way table. Encoded columns hold integer codes, others hold raw values.
+        """
+        return {c: (self.encoder.new_codes() if c in self.encoder else []) for c in WAY_COLUMNS}
+
+    def _append_way(self, row):
+        """
+        Appends a way record to the way table, encoding categorical columns.
+        """
+        for column, value in row.items():
+            if column in self.encoder:
+                self.ways[column].append(self.encoder.encode(column, value))
+            else:
+                self.ways[column].append(value)
+
+    def ways_dataframe(self):
+        """
+        Returns the ways processed so far as a GeoDataFrame. Encoded columns are exposed as pandas Categoricals.
+        """
+        data = {
+            c: (self.encoder.to_categorical(c, v) if c in self.encoder else v)
+            for c, v in self.ways.items()
+        }
+        return gpd.GeoDataFrame(data).set_index('id').set_crs(4326, allow_override=True)
+
+    def _decode_categoricals(self, df):
+        """
+        Converts categorical columns back to plain strings for formats without dictionary support (i.e. shapefiles).
+        """
+        categoricals = [c for c in df.columns if c in self.encoder]
+        return df.astype({c: object for c in categoricals})
 
 
     def _check(self, name, tags):
@@ -257,6 +347,7 @@ class BikeOSM(osmium.SimpleHandler, Utils):
     def _bicycle_route(self, tags):
         """
         This function is used determine if a route is a bicycle route.
+        Membership of route=bicycle relations is added after the file read, see _annotate_routes.
         """
         if 'route' in tags:
             if tags['route'] == 'bicycle':
@@ -362,7 +453,7 @@ class BikeOSM(osmium.SimpleHandler, Utils):
             return
 
         # Append the way with pre-fetched values
-        self.ways.append({
+        self._append_way({
 
             'id': w.id, 
             #'node_ids': ', '.join(str(e) for e in self._get_ways_node_ids(w)),
@@ -373,10 +464,57 @@ class BikeOSM(osmium.SimpleHandler, Utils):
             'svc_rd_typ': self._check('service', tags),
             'turn': self._check('turn', tags),
 
-            'maxspeed': self._get_integers(self._check('maxspeed', tags)), 
             'trf_sgnl': self._has_signalized_int(w,self.traffic_signal_ids),
 
             'surface': self._check('surface', tags),
+
+            'bk_route': self._bicycle_route(tags),
+            'bk_network': None,
+            'bk_rt_ref': None,
+            'bk_rt_name': None,
+
+            **self._rule_attributes(tags),
+
+            'geometry': self._create_geometry('linestring', w)
+        })
+
+        if self.tag_cache is not None:
+            self.tag_cache.append(w.id, tags)
+
+    # handle relations
+    def relation(self, r):
+        """
+        Osmium relation function - collects the way members of route=bicycle relations. Relations follow the ways in a PBF,
+        so the ways are annotated after the file read, see _annotate_routes.
+        """
+        if self.route_collector is not None:
+            self.route_collector.add(r)
+
+    def _annotate_routes(self):
+        """
+        Joins the collected route=bicycle relations to the way table, setting bk_route, bk_network, bk_rt_ref and bk_rt_name
+        of the member ways.
+        """
+        if self.route_collector is None:
+            return
+        index = self.route_collector.to_index()
+        print(f"Indexed {len(index.routes)} bicycle routes with {len(index)} member ways.")
+
+        bicycle_route = self.encoder.encode('bk_route', 'Bicycle Route')
+        for row, routes in index.memberships(self.ways['id']).items():
+            self.ways['bk_route'][row] = bicycle_route
+            self.ways['bk_network'][row] = self.encoder.encode('bk_network', index.network(routes))
+            self.ways['bk_rt_ref'][row] = self.encoder.encode('bk_rt_ref', index.refs(routes))
+            self.ways['bk_rt_name'][row] = self.encoder.encode('bk_rt_name', index.names(routes))
+
+    def _rule_attributes(self, tags):
+        """
+        Returns the way attributes derived from tags through the rule tables. Used both while reading a PBF and by reclassify.
+        params
+            - tags, osmium TagList or dict: tags of the way
+        """
+        return {
+            'maxspeed': self._get_integers(self._check('maxspeed', tags)), 
             'oneway': self._get_oneway(tags),
 
             'lanes_fwd': self._get_integers(self._sided_lanes(tags, 'forward')),
@@ -387,8 +525,6 @@ class BikeOSM(osmium.SimpleHandler, Utils):
             'osmbk_rght': self._osmbike_infra(tags, 'right'),
             # 'desgnatd_bk': self._dsgnatd_bk(tags), # finding this isn't useful. Pulls a lot of sidewalks where bicycles are allowed.
 
-            'bk_route': self._bicycle_route(tags),
-
             'bkwid_left': self._sided_bike_width(tags, 'left'),
             'bkwid_rght': self._sided_bike_width(tags, 'right'),
 
@@ -397,17 +533,92 @@ class BikeOSM(osmium.SimpleHandler, Utils):
 
             'min_bk_inf': self._mm_bike_infra(tags, 'min'),
             'max_bk_inf': self._mm_bike_infra(tags, 'max'),
+        }
 
-            'geometry': self._create_geometry('linestring', w)
-        })
+    def reclassify(self, cache: Union[str, pd.DataFrame], ways: Optional[gpd.GeoDataFrame] = None):
+        """
+        Re-derives the rule based way attributes from a tag cache written by handle_pbfs(tag_cache=True), without reading the PBF.
+        The rule tables are reloaded first, so edits to the static files are picked up.
+        Rules are evaluated once per distinct combination of cached tags and mapped back to the ways.
+        params
+            - cache, string or DataFrame: path to a <filename>_tags.parquet file, or the cache read with cycleosm.tagcache.read_tag_cache
+            - ways, GeoDataFrame: optional ways output of the same file (indexed by id, or with an id column) to update
+        returns
+            - a DataFrame of the rule based attributes indexed by way id, or a copy of ways with them replaced
+        """
+        self.reload_rules()
+        tags_df = read_tag_cache(cache) if isinstance(cache, str) else cache
 
+        categoricals = [tags_df[c].astype('category') for c in tags_df.columns]
+        if categoricals:
+            codes = np.column_stack([c.cat.codes.to_numpy() for c in categoricals])
+            combinations, inverse = np.unique(codes, axis=0, return_inverse=True)
+        else:
+            combinations, inverse = np.zeros((1, 0), dtype=np.int8), np.zeros(len(tags_df), dtype=np.int64)
+
+        rules = []
+        for combination in combinations:
+            tags = {
+                c.name: c.cat.categories[code]
+                for c, code in zip(categoricals, combination) if code != -1
+            }
+            rules.append(self._rule_attributes(tags))
+
+        rules_df = pd.DataFrame(rules).iloc[inverse.reshape(-1)]
+        rules_df.index = tags_df.index
+        rules_df = rules_df.astype({c: 'category' for c in rules_df.columns if c in self.encoder})
+
+        if ways is None:
+            return rules_df
+
+        ways = ways.copy()
+        ids = ways['id'] if 'id' in ways.columns else ways.index
+        for column in rules_df.columns:
+            ways[column] = rules_df[column].reindex(ids).set_axis(ways.index)
+        return ways
+
+    def read_pbf(self, filename):
+        """
+        Reads a PBF file into the node and way tables. Relations are only read when route members are collected
+        (self.route_collector is set), otherwise osmium skips decoding them. Route members are joined to the ways after the read.
+        params
+            - filename, string: path to the PBF file
+        """
+        entities = osmium.osm.osm_entity_bits.NODE | osmium.osm.osm_entity_bits.WAY
+        if self.route_collector is not None:
+            entities |= osmium.osm.osm_entity_bits.RELATION
+
+        reader = osmium.io.Reader(filename, entities)
+        # node locations are needed to build way geometries
+        locations = osmium.NodeLocationsForWays(osmium.index.create_map('flex_mem'))
+        locations.ignore_errors()
+        try:
+            osmium.apply(reader, locations, self)
+        finally:
+            reader.close()
 
-    def handle_pbfs(self, files=None, output_path=None, handle_ways=True, handle_nodes=True):
+        self._annotate_routes()
+
+
+    def handle_pbfs(self, files=None, output_path=None, handle_ways=True, handle_nodes=True, output_format='shp', route_relations=True, tile_zoom=10, tag_cache=False):
         """
         Handles  PBF files, processes them, and outputs to Shapefile format.
+        params
+            - route_relations, bool: annotate ways with the route=bicycle relations they belong to (bk_route, bk_network, bk_rt_ref, bk_rt_name).
+              When False (or handle_ways is False), relations are not read at all.
+              Route members are collected during the file read and joined to the ways afterwards, see cycleosm.routes.
+            - output_format, string: 'shp' (default), 'parquet', 'feather' or 'tiles'. Parquet and Feather keep categorical columns dictionary encoded.
+              Feather files are written uncompressed so consumers can memory-map them, see cycleosm.arrowio.read_ways_feather.
+              'tiles' partitions the ways of all files into a shared quadkey tile directory, query it with cycleosm.tiles.read_bbox.
+            - tile_zoom, int: zoom level of the tile grid when output_format is 'tiles'.
+            - tag_cache, bool: also write the raw rule tags of each kept way to <filename>_tags.parquet, see reclassify.
         """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Invalid `output_format` option: {output_format}. Expected one of {OUTPUT_FORMATS}.")
         files = self.pbf_dict if files == None else files 
         output_path = self.output_path if output_path == None else output_path
+        if handle_ways and output_format == 'tiles':
+            check_zoom(os.path.join(output_path, TILES_DIRNAME), tile_zoom)
         downloader = PBFDownloader(self.pbf_dict, self.output_path)
         o_startime = time.time()
         def process_file(filename, output_path):
@@ -418,16 +629,32 @@ class BikeOSM(osmium.SimpleHandler, Utils):
             full_filename = os.path.join(output_path, filename + '.pbf')
             print(f"Processing {full_filename}")
 
-            # Apply file and process nodes and ways
-            self.apply_file(full_filename, locations=True)
+            # Apply file and process nodes and ways (and relations if route members are collected)
+            self.read_pbf(full_filename)
             
             # Output file paths
-            ways_output = os.path.join(output_path, filename + '_ways.shp')
+            if output_format == 'tiles':
+                ways_output = os.path.join(output_path, TILES_DIRNAME)
+            else:
+                ways_output = os.path.join(output_path, filename + '_ways.' + output_format)
             nodes_output = os.path.join(output_path, filename + '_nodes.shp')
 
-            if handle_ways and self.ways:
-                ways_df = gpd.GeoDataFrame(self.ways).set_index('id').set_crs(4326, allow_override=True)
-                ways_df.to_file(ways_output)
+            if handle_ways and self.ways['id']:
+                ways_df = self.ways_dataframe()
+                if output_format == 'parquet':
+                    ways_df.to_parquet(ways_output)
+                elif output_format == 'feather':
+                    write_ways_feather(ways_df, ways_output)
+                elif output_format == 'tiles':
+                    write_tiles(ways_df, ways_output, filename, tile_zoom)
+                else:
+                    self._decode_categoricals(ways_df).to_file(ways_output)
+            elif handle_ways and output_format == 'tiles':
+                # drop tiles of a previous run of this file
+                remove_tiles(ways_output, filename)
+
+            if self.tag_cache is not None and len(self.tag_cache):
+                self.tag_cache.write(os.path.join(output_path, filename + '_tags.parquet'))
 
             if handle_nodes and self.nodes:
                 nodes_df = gpd.GeoDataFrame(self.nodes).set_index('id').set_crs(4326, allow_override=True)
@@ -437,7 +664,10 @@ class BikeOSM(osmium.SimpleHandler, Utils):
 
         for f, url in files.items():
             downloader.download_pbf(url, f)
-            self.ways = []
+            self.encoder = self._build_encoder()
+            self.ways = self._new_ways()
+            self.route_collector = BicycleRouteCollector() if handle_ways and route_relations else None
+            self.tag_cache = TagCache() if handle_ways and tag_cache else None
             self.traffic_signal_ids = []
             self.nodes = {'id': [], 'trfc_sgnls': [], 'geometry': []}
             process_file(f, output_path)
@@ -0,0 +1,129 @@
+"""
+Categorical encoding of repeated OSM tag values.
+
+Most way attributes written by BikeOSM (fclass, oneway, bike infrastructure classes, ...) come from a
+handful of values defined in the static rule files. Rather than holding one Python string per row, the
+handler stores a small integer code per row and keeps the distinct strings once in a vocabulary.
+Codes are exposed on output as pandas Categorical columns (Arrow dictionary columns once written to Parquet/Feather).
+
+This module contains two classes and a helper:
+    - TagVocabulary: maps the values of one attribute to integer codes. Seeded from the static rule files,
+      with a growable overflow for values that are not known up front (e.g. surface, name).
+    - TagEncoder: holds the vocabularies for each encoded column of a way table.
+    - concat_categorical: combines ways of several files. Vocabularies are built per PBF, so overflow
+      categories differ between files and a plain pd.concat would fall back to object columns.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+# code used for missing values, matches pandas.Categorical.from_codes
+MISSING = -1
+
+
+class TagVocabulary:
+    """
+    Maps the string values of a single attribute to small integer codes.
+    """
+    def __init__(self, fixed: Optional[Iterable[str]] = None):
+        """
+        Initializes the vocabulary.
+
+        Args:
+            fixed (Optional[Iterable[str]]): Values known up front, i.e. from the static rule files.
+                They always receive the lowest codes, in the order given. Duplicates are ignored.
+        """
+        self.categories: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for value in fixed or []:
+            self._add(value)
+
+    def _add(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.categories)
+            self._codes[value] = code
+            self.categories.append(value)
+        return code
+
+    def encode(self, value: Optional[str]) -> int:
+        """
+        Returns the code for a value, appending it to the overflow if it is not yet known.
+
+        Args:
+            value (Optional[str]): Tag value, None for missing.
+
+        Returns:
+            int: Integer code, MISSING (-1) if value is None.
+        """
+        if value is None:
+            return MISSING
+        code = self._codes.get(value)
+        if code is None:
+            code = self._add(value)
+        return code
+
+
+class TagEncoder:
+    """
+    Holds one TagVocabulary per encoded column. Several columns may share a vocabulary
+    (e.g. left and right bike infrastructure) so they expose identical categories.
+    """
+    def __init__(self, vocabularies: Dict[str, TagVocabulary]):
+        """
+        Args:
+            vocabularies (Dict[str, TagVocabulary]): Mapping of column name to vocabulary.
+        """
+        self.vocabularies = vocabularies
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.vocabularies
+
+    def encode(self, column: str, value: Optional[str]) -> int:
+        return self.vocabularies[column].encode(value)
+
+    def new_codes(self) -> array:
+        """
+        Returns an empty, compact code buffer (4 bytes per row).
+        """
+        return array('i')
+
+    def to_categorical(self, column: str, codes: Iterable[int]) -> pd.Categorical:
+        """
+        Builds a pandas Categorical from stored codes without decoding them into strings.
+
+        Args:
+            column (str): Column name.
+            codes (Iterable[int]): Codes stored for the column.
+
+        Returns:
+            pd.Categorical: Categorical sharing the column's vocabulary as categories.
+        """
+        return pd.Categorical.from_codes(
+            np.asarray(codes, dtype=np.int32),
+            categories=pd.Index(self.vocabularies[column].categories, dtype=object)
+        )
+
+
+def concat_categorical(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates DataFrames, e.g. ways of several PBF files, taking the union of the categories of each
+    categorical column so the result stays categorical.
+
+    Args:
+        frames (Sequence[pd.DataFrame]): DataFrames with the same columns.
+
+    Returns:
+        pd.DataFrame: Concatenated DataFrame.
+    """
+    columns = [c for c in frames[0].columns if any(isinstance(f[c].dtype, pd.CategoricalDtype) for f in frames)]
+    for column in columns:
+        categories = {}
+        for f in frames:
+            values = f[column].cat.categories if isinstance(f[column].dtype, pd.CategoricalDtype) else f[column].dropna().unique()
+            categories.update(dict.fromkeys(values))
+        dtype = pd.CategoricalDtype(pd.Index(list(categories), dtype=object))
+        frames = [f.assign(**{column: f[column].astype(dtype)}) for f in frames]
+    return pd.concat(frames)
@@ -0,0 +1,124 @@
+"""
+Bicycle route relation membership.
+
+In OSM, route=bicycle is tagged on relations, not on the member ways. BikeOSM collects the way members of
+route=bicycle relations in its relation callback during the regular file read. PBF files store relations
+after the ways, so the ways are annotated in one join over the way table once the read has finished.
+
+This module contains two classes:
+    - BicycleRouteCollector: collects route=bicycle relations and their way members.
+    - BicycleRouteIndex: sorted way id -> route index.
+"""
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+Route = namedtuple('Route', ['network', 'ref', 'name'])
+
+# bicycle network levels, from highest to lowest
+NETWORK_LEVELS = ['icn', 'ncn', 'rcn', 'lcn']
+
+
+class BicycleRouteCollector:
+    """
+    Collects route=bicycle relations and their way members.
+    """
+    def __init__(self):
+        self.routes: List[Route] = []
+        self.way_ids: List[int] = []
+        self.route_ids: List[int] = []
+
+    def add(self, r) -> None:
+        """
+        Records the way members of a relation if it is a route=bicycle relation.
+
+        Args:
+            r (osmium.osm.Relation): Relation from an osmium relation callback.
+        """
+        tags = r.tags
+        if tags.get('route') != 'bicycle':
+            return
+
+        route_id = len(self.routes)
+        self.routes.append(Route(tags.get('network'), tags.get('ref'), tags.get('name')))
+        for member in r.members:
+            if member.type == 'w':
+                self.way_ids.append(member.ref)
+                self.route_ids.append(route_id)
+
+    def to_index(self) -> 'BicycleRouteIndex':
+        """
+        Returns the collected routes as a BicycleRouteIndex.
+        """
+        return BicycleRouteIndex(self.way_ids, self.route_ids, self.routes)
+
+
+class BicycleRouteIndex:
+    """
+    Compact way id -> bicycle route index. Way ids are held in a sorted int64 array with a parallel array
+    of route numbers, a way that belongs to several routes appears once per route.
+    """
+    def __init__(self, way_ids=None, route_ids=None, routes: Optional[List[Route]] = None):
+        """
+        Args:
+            way_ids (Optional[Iterable[int]]): Member way ids.
+            route_ids (Optional[Iterable[int]]): Position in routes of the relation each way id belongs to.
+            routes (Optional[List[Route]]): Route attributes.
+        """
+        way_ids = np.asarray(way_ids if way_ids is not None else [], dtype=np.int64)
+        route_ids = np.asarray(route_ids if route_ids is not None else [], dtype=np.int32)
+        order = np.argsort(way_ids, kind='stable')
+        self.way_ids = way_ids[order]
+        self.route_ids = route_ids[order]
+        self.routes = routes or []
+
+    def __len__(self) -> int:
+        return len(self.way_ids)
+
+    def memberships(self, way_ids) -> Dict[int, Tuple[Route, ...]]:
+        """
+        Joins a way table to the index.
+
+        Args:
+            way_ids (Iterable[int]): Way id column of a way table.
+
+        Returns:
+            Dict[int, Tuple[Route, ...]]: Row position -> routes, for the rows that belong to at least one route.
+        """
+        if not len(self.way_ids):
+            return {}
+        way_ids = np.asarray(way_ids, dtype=np.int64)
+        start = np.searchsorted(self.way_ids, way_ids, side='left')
+        end = np.searchsorted(self.way_ids, way_ids, side='right')
+        return {
+            int(row): tuple(self.routes[i] for i in self.route_ids[start[row]:end[row]])
+            for row in np.nonzero(end > start)[0]
+        }
+
+    @staticmethod
+    def network(routes: Tuple[Route, ...]) -> Optional[str]:
+        """
+        Returns the highest network level (icn > ncn > rcn > lcn) of the given routes.
+        """
+        levels = [r.network for r in routes if r.network in NETWORK_LEVELS]
+        if levels:
+            return min(levels, key=NETWORK_LEVELS.index)
+
+    @staticmethod
+    def refs(routes: Tuple[Route, ...]) -> Optional[str]:
+        """
+        Returns the distinct refs of the given routes, separated by ';'.
+        """
+        refs = sorted({r.ref for r in routes if r.ref})
+        if refs:
+            return ';'.join(refs)
+
+    @staticmethod
+    def names(routes: Tuple[Route, ...]) -> Optional[str]:
+        """
+        Returns the distinct names of the given routes, separated by ';'.
+        """
+        names = sorted({r.name for r in routes if r.name})
+        if names:
+            return ';'.join(names)
@@ -0,0 +1,82 @@
+"""
+Raw tag cache of kept ways.
+
+The bike infrastructure columns written by BikeOSM are derived from a handful of tags through the rules in the
+static files. With handle_pbfs(tag_cache=True), the relevant raw tags of each kept way are also written to a
+columnar <filename>_tags.parquet file, so BikeOSM.reclassify() can re-derive the columns after a rule change
+without reading the PBF again.
+
+Cached tags are highway, maxspeed and every key starting with cycleway, oneway or lanes. Values are held as
+categorical codes while processing, see cycleosm.encoding.
+"""
+
+from array import array
+import numpy as np
+import pandas as pd
+from cycleosm.encoding import MISSING, TagEncoder, TagVocabulary
+
+CACHED_TAGS = ('highway', 'maxspeed')
+CACHED_PREFIXES = ('cycleway', 'oneway', 'lanes')
+
+
+class TagCache:
+    """
+    Column oriented cache of the raw tags used by the bike infrastructure rules.
+    """
+    def __init__(self):
+        self.ids = array('q')
+        self.encoder = TagEncoder({})
+        self.codes = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, way_id: int, tags) -> None:
+        """
+        Appends the cached tags of a way.
+
+        Args:
+            way_id (int): OSM way id.
+            tags (osmium.osm.TagList): Tags of the way.
+        """
+        row = len(self.ids)
+        self.ids.append(way_id)
+
+        for tag in tags:
+            k = tag.k
+            if k in CACHED_TAGS or k.startswith(CACHED_PREFIXES):
+                if k not in self.codes:
+                    # new key, earlier rows are missing
+                    self.encoder.vocabularies[k] = TagVocabulary()
+                    self.codes[k] = array('i', [MISSING] * row)
+                self.codes[k].append(self.encoder.encode(k, tag.v))
+
+        for codes in self.codes.values():
+            if len(codes) == row:
+                codes.append(MISSING)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the cache as a DataFrame indexed by way id, with one categorical column per tag key.
+        """
+        data = {k: self.encoder.to_categorical(k, codes) for k, codes in sorted(self.codes.items())}
+        return pd.DataFrame(data, index=pd.Index(np.asarray(self.ids, dtype=np.int64), name='id'))
+
+    def write(self, filepath: str) -> None:
+        """
+        Writes the cache to a Parquet file.
+        """
+        self.to_dataframe().to_parquet(filepath)
+
+
+def read_tag_cache(filepath: str) -> pd.DataFrame:
+    """
+    Reads a tag cache written by TagCache.write.
+
+    Args:
+        filepath (str): Path to the Parquet file.
+
+    Returns:
+        pd.DataFrame: Cached tags indexed by way id.
+    """
+    return pd.read_parquet(filepath)
@@ -0,0 +1,241 @@
+"""
+Tile-partitioned way output for fast regional queries.
+
+BikeOSM can write ways into a quadkey tile grid (handle_pbfs(output_format='tiles')). Each tile holds one
+GeoParquet file per source PBF and a manifest records the data extent and row count of every file, so
+regional queries only read the tiles that intersect the requested bounding box.
+
+Layout of a tile directory:
+    manifest.json
+    <quadkey>/<source>-<run>.parquet
+
+Each write uses new file names and only removes the superseded files once the manifest points to the new
+ones, so an interrupted write never leaves the manifest referring to deleted files.
+
+Ways are assigned to the tile containing the center of their bounding box. The manifest stores the actual
+extent of the ways in each file, so ways crossing a tile border are still found by read_bbox.
+"""
+
+import json
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from cycleosm.encoding import concat_categorical
+
+MANIFEST = 'manifest.json'
+
+# web mercator latitude limits
+MAX_LATITUDE = 85.05112878
+
+
+def quadkeys(geometries: gpd.GeoSeries, zoom: int) -> np.ndarray:
+    """
+    Returns the quadkey of the tile containing the bounding box center of each geometry.
+
+    Args:
+        geometries (gpd.GeoSeries): Geometries in EPSG:4326.
+        zoom (int): Tile zoom level, 1 to 23.
+
+    Returns:
+        np.ndarray: Quadkey strings.
+    """
+    _check_zoom_range(zoom)
+
+    bounds = geometries.bounds
+    lon = ((bounds['minx'] + bounds['maxx']) / 2).to_numpy()
+    lat = np.clip(((bounds['miny'] + bounds['maxy']) / 2).to_numpy(), -MAX_LATITUDE, MAX_LATITUDE)
+
+    n = 2 ** zoom
+    x = np.clip(np.floor((lon + 180) / 360 * n), 0, n - 1).astype(np.int64)
+    lat_rad = np.radians(lat)
+    y = np.floor((1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2 * n)
+    y = np.clip(y, 0, n - 1).astype(np.int64)
+
+    # build quadkeys once per distinct tile
+    tiles, inverse = np.unique(x * n + y, return_inverse=True)
+    keys = np.array([_quadkey(t // n, t % n, zoom) for t in tiles], dtype=object)
+    return keys[inverse.reshape(-1)]
+
+
+def _quadkey(x: int, y: int, zoom: int) -> str:
+    # interleave x and y bits, most significant first
+    digits = []
+    for i in range(zoom, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def _check_zoom_range(zoom: int) -> None:
+    if not 1 <= zoom <= 23:
+        raise ValueError(f"Invalid `zoom` option: {zoom}. Expected a zoom level between 1 and 23.")
+
+
+def check_zoom(directory: str, zoom: int) -> None:
+    """
+    Checks that tiles can be written to a directory at a zoom level, i.e. the zoom is in range and matches
+    the zoom of an existing manifest. Call it before processing a PBF so a bad zoom fails early.
+
+    Args:
+        directory (str): Tile directory.
+        zoom (int): Tile zoom level.
+
+    Raises:
+        ValueError: If the zoom is out of range or differs from the existing manifest.
+    """
+    _check_zoom_range(zoom)
+    _load_manifest(directory, zoom)
+
+
+def _load_manifest(directory: str, zoom: Optional[int] = None) -> Dict:
+    filepath = os.path.join(directory, MANIFEST)
+    if not os.path.exists(filepath):
+        if zoom is None:
+            raise FileNotFoundError(f"No tile manifest found in {directory}.")
+        return {'zoom': zoom, 'tiles': []}
+
+    with open(filepath, mode='r', encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    if zoom is not None and manifest['zoom'] != zoom:
+        raise ValueError(f"Tiles in {directory} use zoom {manifest['zoom']}, cannot add tiles at zoom {zoom}.")
+    return manifest
+
+
+def write_tiles(ways_df: gpd.GeoDataFrame, directory: str, source: str, zoom: int = 10) -> Dict:
+    """
+    Partitions ways into quadkey tiles and writes one GeoParquet file per tile. Previous tiles written
+    for the same source are replaced, tiles of other sources (e.g. other states) are kept.
+
+    Args:
+        ways_df (gpd.GeoDataFrame): Ways in EPSG:4326, e.g. from BikeOSM.ways_dataframe().
+        directory (str): Tile directory, shared by all sources of a dataset.
+        source (str): Name of the source PBF, i.e. the state.
+        zoom (int, optional): Tile zoom level. Defaults to 10 (tiles of roughly 40 km at the equator).
+
+    Returns:
+        Dict: The updated manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    check_zoom(directory, zoom)
+    run = uuid.uuid4().hex[:8]
+
+    # ways without a geometry cannot be located, nor returned by a bbox query
+    ways_df = ways_df[~ways_df.geometry.isna()]
+    keys = quadkeys(ways_df.geometry, zoom)
+    tiles = []
+    for key, tile_df in ways_df.groupby(keys, sort=True):
+        path = os.path.join(key, f"{source}-{run}.parquet")
+        os.makedirs(os.path.join(directory, key), exist_ok=True)
+        # keep only the categories used in the tile, not the whole state's dictionary
+        categoricals = [c for c in tile_df.columns if isinstance(tile_df[c].dtype, pd.CategoricalDtype)]
+        tile_df = tile_df.assign(**{c: tile_df[c].cat.remove_unused_categories() for c in categoricals})
+        tile_df.to_parquet(os.path.join(directory, path))
+        tiles.append({
+            'quadkey': key,
+            'source': source,
+            'path': path,
+            'bounds': [float(b) for b in tile_df.total_bounds],
+            'rows': len(tile_df),
+        })
+
+    return _replace_source(directory, source, tiles, zoom)
+
+
+def remove_tiles(directory: str, source: str) -> Dict:
+    """
+    Removes the tiles of a source, e.g. when a rerun of its PBF yields no ways.
+
+    Args:
+        directory (str): Tile directory.
+        source (str): Name of the source PBF.
+
+    Returns:
+        Dict: The updated manifest.
+    """
+    if not os.path.exists(os.path.join(directory, MANIFEST)):
+        return {'tiles': []}
+    return _replace_source(directory, source, [])
+
+
+def _replace_source(directory: str, source: str, tiles: List[Dict], zoom: Optional[int] = None) -> Dict:
+    """
+    Points the manifest to the given tiles of a source, then removes the files they supersede.
+    """
+    manifest = _load_manifest(directory, zoom)
+    superseded = [t for t in manifest['tiles'] if t['source'] == source]
+    tiles = [t for t in manifest['tiles'] if t['source'] != source] + tiles
+    manifest['tiles'] = sorted(tiles, key=lambda t: (t['quadkey'], t['source']))
+
+    # write the manifest to a temporary file first so it is replaced atomically
+    filepath = os.path.join(directory, MANIFEST)
+    with open(filepath + '.tmp', mode='w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(filepath + '.tmp', filepath)
+
+    current = {t['path'] for t in tiles}
+    for tile in superseded:
+        old = os.path.join(directory, tile['path'])
+        if tile['path'] not in current and os.path.exists(old):
+            os.remove(old)
+    return manifest
+
+
+def tiles_in_bbox(directory: str, bbox: Tuple[float, float, float, float]) -> List[Dict]:
+    """
+    Returns the manifest entries whose data extent intersects a bounding box.
+
+    Args:
+        directory (str): Tile directory.
+        bbox (Tuple[float, float, float, float]): (minx, miny, maxx, maxy) in EPSG:4326.
+    """
+    minx, miny, maxx, maxy = bbox
+    return [
+        t for t in _load_manifest(directory)['tiles']
+        if t['bounds'][0] <= maxx and t['bounds'][2] >= minx and t['bounds'][1] <= maxy and t['bounds'][3] >= miny
+    ]
+
+
+def read_bbox(
+    directory: str,
+    bbox: Tuple[float, float, float, float],
+    columns: Optional[List[str]] = None
+) -> gpd.GeoDataFrame:
+    """
+    Reads the ways intersecting a bounding box, only opening the tiles that overlap it.
+
+    Ways on a border between sources (e.g. states) can be contained in both source extracts and are then
+    returned once per source. Drop duplicates on the way id if needed.
+
+    Args:
+        directory (str): Tile directory.
+        bbox (Tuple[float, float, float, float]): (minx, miny, maxx, maxy) in EPSG:4326.
+        columns (Optional[List[str]]): Subset of columns to read. Defaults to all columns.
+
+    Returns:
+        Union[gpd.GeoDataFrame, pd.DataFrame]: Ways whose geometry intersects bbox. A DataFrame without
+            geometries if columns does not include geometry.
+    """
+    minx, miny, maxx, maxy = bbox
+
+    # the geometry is needed to filter on bbox, drop it afterwards if it was not asked for
+    drop_geometry = columns is not None and 'geometry' not in columns
+    if drop_geometry:
+        columns = list(columns) + ['geometry']
+
+    frames = [
+        gpd.read_parquet(os.path.join(directory, t['path']), columns=columns)
+        for t in tiles_in_bbox(directory, bbox)
+    ]
+    if not frames:
+        ways_df = gpd.GeoDataFrame({c: [] for c in columns or [] if c != 'geometry'}, geometry=[], crs=4326)
+    else:
+        ways_df = concat_categorical(frames) if len(frames) > 1 else frames[0]
+        ways_df = ways_df.cx[minx:maxx, miny:maxy]
+
+    if drop_geometry:
+        return ways_df.drop(columns='geometry')
+    return ways_df